@@ -0,0 +1,134 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+
+import constants
+from .cache import get_version
+
+
+class TokenCache:
+    """LRU-кеш токенов внутри процесса.
+
+    Записи живут не дольше ttl, ненайденные токены — negative_ttl.
+    Версия 'tokens' проверяется при каждом обращении, поэтому её смена
+    очищает кеш каждого процесса на его следующем запросе. Это верно
+    только для кеша, общего для процессов: с локальным кешем процесса
+    приложение не запустится (см. check_token_cache).
+    """
+
+    version_name = 'tokens'
+
+    def __init__(self, maxsize, ttl, negative_ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = self.negative_hits = self.misses = 0
+
+    def get(self, key):
+        """Пара (найден ли ключ в кеше, токен или None)."""
+        version = get_version(self.version_name)
+        now = time.monotonic()
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return True, entry[1]
+
+    def set(self, key, token):
+        ttl = self.ttl if token is not None else self.negative_ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for key, (expires, token) in list(self._entries.items()):
+                if token is not None and token.user_id == user_id:
+                    del self._entries[key]
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': ((self.hits + self.negative_hits) / lookups
+                         if lookups else None),
+        }
+
+
+token_cache = TokenCache(constants.TOKEN_CACHE_SIZE,
+                         constants.TOKEN_CACHE_TTL,
+                         constants.TOKEN_CACHE_NEGATIVE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который не ходит в базу за известными токенами.
+
+    Каждый запрос получает свои копии токена и пользователя,
+    чтобы изменения в них не попадали в кеш.
+    """
+
+    def authenticate_credentials(self, key):
+        found, token = token_cache.get(key)
+        if not found:
+            token = self.get_model().objects.select_related('user').filter(
+                key=key).first()
+            token_cache.set(key, token)
+        if token is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        user = copy.copy(token.user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
+
+
+def check_token_cache():
+    """Не даёт запустить кеш токенов без общего для процессов кеша.
+
+    С LocMemCache выход, деактивация и удаление токена дошли бы только
+    до обработавшего их процесса, а остальные принимали бы отозванный
+    токен ещё до TOKEN_CACHE_TTL секунд.
+    """
+    if not any(issubclass(authentication, CachedTokenAuthentication)
+               for authentication
+               in api_settings.DEFAULT_AUTHENTICATION_CLASSES):
+        return
+    if isinstance(caches['default'], (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            'CachedTokenAuthentication требует общий для процессов кеш: '
+            'задайте CACHE_BACKEND, например FileBasedCache или memcached.'
+        )
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+import constants
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    """Текущая версия набора данных name, общая для процессов с кешем."""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Помечает устаревшими все копии набора данных name.
+
+    Пишется новое случайное значение, а не incr: в файловом кеше incr
+    не атомарен, и одновременные смены версии могли бы совпасть.
+    """
+    cache.set(_version_key(name), uuid.uuid4().hex, timeout=None)
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует ответы list и retrieve для анонимных пользователей.
+
+    Ключ строится из адреса и нормализованных параметров запроса
+    и версии response_cache_version. Запросы с другими параметрами
+    не кешируются. В заголовке X-Cache отдаётся HIT, MISS или BYPASS.
+    """
+
+    response_cache_version = None
+    response_cache_params = ('tags', 'author', 'page', 'limit', 'cursor',
+                             'ordering')
+    response_cache_ignored_params = ('is_favorited', 'is_in_shopping_cart')
+    response_cache_timeout = constants.RESPONSE_CACHE_TIMEOUT
+
+    def get_response_cache_key(self, request):
+        params = []
+        for name, values in sorted(request.query_params.lists()):
+            if name in self.response_cache_ignored_params:
+                continue
+            if name not in self.response_cache_params:
+                return None
+            params.append((name, sorted(values)))
+        key = json.dumps([
+            get_version(self.response_cache_version),
+            request.scheme, request.get_host(), request.path, params
+        ])
+        return 'response:' + hashlib.md5(key.encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        if key is None:
+            response = handler(request, *args, **kwargs)
+            response['X-Cache'] = 'BYPASS'
+            return response
+        data = cache.get(key)
+        if data is not None:
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, self.response_cache_timeout)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request,
+                                    *args, **kwargs)
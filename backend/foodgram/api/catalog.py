@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import re
+import threading
+import time
+from bisect import bisect_left
+from io import BytesIO
+from collections import defaultdict
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient, Tag
+from .cache import get_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ACCEPTS_ENCODING = {
+    'br': re.compile(r'\bbr\b'),
+    'gzip': re.compile(r'\bgzip\b'),
+}
+
+
+def gzip_compress(content):
+    """gzip с нулевым mtime, чтобы тело не менялось от сборки к сборке."""
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+def render_bodies(data):
+    """JSON-представление data без сжатия и в поддерживаемых сжатиях."""
+    content = JSONRenderer().render(data)
+    bodies = {'gzip': gzip_compress(content), None: content}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(content)
+    etag = '"{}"'.format(hashlib.sha256(content).hexdigest()[:32])
+    return etag, bodies
+
+
+def conditional_response(request, etag, bodies, last_modified=None):
+    """Ответ 304 для актуальной копии клиента или тело в нужном сжатии."""
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        encoding = next(
+            (name for name, pattern in ACCEPTS_ENCODING.items()
+             if name in bodies and pattern.search(accept_encoding)),
+            None
+        )
+        response = HttpResponse(bodies[encoding],
+                                content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+class VersionedCatalog:
+    """Данные в памяти процесса, собранные заново при смене версии."""
+
+    version_name = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def get_data(self):
+        version = get_version(self.version_name)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._data = self.build()
+                    self._version = version
+        return self._data
+
+
+class IngredientIndex(VersionedCatalog):
+    """Индекс ингредиентов для автодополнения.
+
+    Префиксы ищутся бинарным поиском по отсортированным названиям,
+    подстроки — по карте n-грамм.
+    """
+
+    version_name = 'ingredients'
+    gram_size = 3
+
+    def build(self):
+        items = sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda item: (item['name'].lower(), item['id'])
+        )
+        names = [item['name'].lower() for item in items]
+        grams = defaultdict(set)
+        for position, name in enumerate(names):
+            for size in range(1, self.gram_size + 1):
+                for start in range(len(name) - size + 1):
+                    grams[name[start:start + size]].add(position)
+        return names, items, dict(grams)
+
+    def search(self, query):
+        """Ингредиенты, содержащие query: сначала совпавшие по началу."""
+        query = query.strip().lower()
+        names, items, grams = self.get_data()
+        if not query:
+            return list(items)
+        start = bisect_left(names, query)
+        end = bisect_left(names, query + '\U0010ffff', start)
+        size = min(len(query), self.gram_size)
+        candidates = set.intersection(*(
+            grams.get(query[index:index + size], set())
+            for index in range(len(query) - size + 1)
+        ))
+        contains = sorted(
+            position for position in candidates
+            if not start <= position < end and query in names[position]
+        )
+        return items[start:end] + [items[position] for position in contains]
+
+
+class IngredientSnapshot(VersionedCatalog):
+    """Полный список ингредиентов, заранее сжатый, с ETag по содержимому."""
+
+    version_name = 'ingredients'
+
+    def build(self):
+        return render_bodies(list(
+            Ingredient.objects.values('id', 'name', 'measurement_unit')
+        ))
+
+    def response(self, request):
+        etag, bodies = self.get_data()
+        return conditional_response(request, etag, bodies)
+
+
+class TagCatalog(VersionedCatalog):
+    """Теги для списка тегов, вложенных тегов рецептов и фильтра."""
+
+    version_name = 'tags'
+
+    def build(self):
+        items = list(Tag.objects.values('id', 'name', 'color', 'slug'))
+        etag, bodies = render_bodies(items)
+        return {
+            'items': items,
+            'by_id': {item['id']: item for item in items},
+            'by_slug': {item['slug']: item for item in items},
+            'etag': etag,
+            'bodies': bodies,
+            'last_modified': int(time.time()),
+        }
+
+    def get(self, pk):
+        return self.get_data()['by_id'].get(pk)
+
+    def choices(self):
+        return [(item['slug'], item['name'])
+                for item in self.get_data()['items']]
+
+    def ids(self, slugs):
+        by_slug = self.get_data()['by_slug']
+        return [by_slug[slug]['id'] for slug in slugs if slug in by_slug]
+
+    def response(self, request):
+        data = self.get_data()
+        return conditional_response(request, data['etag'], data['bodies'],
+                                    data['last_modified'])
+
+
+ingredient_index = IngredientIndex()
+ingredient_snapshot = IngredientSnapshot()
+tag_catalog = TagCatalog()
@@ -1,15 +1,22 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe
+from recipes.models import Recipe
+from .catalog import tag_catalog
 
 
 User = get_user_model()
 
 
+def tag_choices():
+    return tag_catalog.choices()
+
+
 class RecipeFilter(FilterSet):
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags'
     )
 
     is_favorited = filters.BooleanFilter(
@@ -24,22 +31,22 @@ class RecipeFilter(FilterSet):
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=tag_catalog.ids(value)
+        )))
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(carts__user=user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
-
-
-class IngredientSearchFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='icontains')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
@@ -1,8 +1,250 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from functools import partial
+from operator import attrgetter
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 import constants
+from .cache import get_version
+
+
+class KeysetPagination(BasePagination):
+    """Постраничный вывод по курсору без COUNT(*) и OFFSET.
+
+    Курсор хранит значения ключа сортировки и id последней записи,
+    следующая страница выбирается условием «строго после» этой пары.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = constants.PAGE_SIZE
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    @staticmethod
+    def get_ordering(queryset):
+        ordering = tuple(queryset.query.order_by
+                         or queryset.model._meta.ordering)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('id',)
+        return ordering
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}'
+                     for field in ordering)
+
+    @staticmethod
+    def after(ordering, position):
+        """Условие «строго после position» для сортировки ordering."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return cursor['p'], bool(cursor['r'])
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        position = [attrgetter(field.lstrip('-'))(obj)
+                    for field in self.ordering]
+        encoded = base64.urlsafe_b64encode(json.dumps(
+            {'p': position, 'r': reverse}, default=str
+        ).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param, encoded)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+        ordering = (self.reverse_ordering(self.ordering) if reverse
+                    else self.ordering)
+        queryset = queryset.order_by(*ordering)
+        try:
+            if position is not None:
+                if len(position) != len(ordering):
+                    raise NotFound(self.invalid_cursor_message)
+                queryset = queryset.filter(self.after(ordering, position))
+            results = list(queryset[:page_size + 1])
+        except (ValueError, TypeError, ValidationError):
+            # Курсор разобран, но значения в нём не того типа.
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(results) > page_size
+        self.page = results[:page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class FeedPagination(KeysetPagination):
+    """Курсор по записям ленты, от новых рецептов к старым."""
+
+    @staticmethod
+    def get_ordering(queryset):
+        return ('-recipe_id',)
+
+
+class CachedCount:
+    """Число записей для постраничного вывода.
+
+    Точное значение кешируется по нормализованному набору фильтров
+    и версии данных представления. Для большой таблицы без фильтров
+    берётся оценка планировщика PostgreSQL.
+    """
+
+    ignored_params = ('page', 'limit', 'cursor', 'ordering')
+    user_params = ('is_favorited', 'is_in_shopping_cart')
+    timeout = constants.COUNT_CACHE_TIMEOUT
+    estimate_threshold = constants.COUNT_ESTIMATE_THRESHOLD
+
+    def __init__(self, request, version_name):
+        self.request = request
+        self.version_name = version_name
+        self.filters = sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+            if name not in self.ignored_params
+        )
+
+    def get_key(self):
+        versions = [get_version(self.version_name)]
+        user_id = None
+        user = self.request.user
+        if user.is_authenticated and any(
+                name in self.user_params for name, _ in self.filters):
+            # Версии разных пользователей могут совпасть, поэтому id
+            # тоже входит в ключ.
+            user_id = user.id
+            versions.append(get_version(f'{self.version_name}:{user_id}'))
+        key = json.dumps([self.request.path, user_id, versions, self.filters])
+        return 'count:' + hashlib.md5(key.encode()).hexdigest()
+
+    @staticmethod
+    def estimate(model):
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] > 0 else None
+
+    def __call__(self, queryset):
+        """Пара (число записей, является ли оно оценкой)."""
+        if not self.filters:
+            estimate = self.estimate(queryset.model)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate, True
+        key = self.get_key()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.timeout)
+        return count, False
+
+
+class CountedPaginator(Paginator):
+    """Paginator, который берёт число записей у count_strategy."""
+
+    def __init__(self, *args, count_strategy, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy
+        self.count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        count, self.count_is_approximate = self.count_strategy(
+            self.object_list)
+        return count
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничный вывод по номеру страницы или, с ?cursor=, по курсору.
+
+    Если у представления задан count_cache_version, число записей
+    считается через CachedCount.
+    """
+
     page_size_query_param = 'limit'
     page_size = constants.PAGE_SIZE
+    cursor_pagination_class = KeysetPagination
+    count_strategy_class = CachedCount
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_pagination_class.cursor_query_param in (
+                request.query_params):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        version_name = getattr(view, 'count_cache_version', None)
+        if version_name is not None:
+            self.django_paginator_class = partial(
+                CountedPaginator,
+                count_strategy=self.count_strategy_class(request,
+                                                         version_name)
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        paginator = self.page.paginator
+        if isinstance(paginator, CountedPaginator):
+            response.data['count_is_approximate'] = (
+                paginator.count_is_approximate)
+        return response
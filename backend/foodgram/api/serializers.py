@@ -1,11 +1,14 @@
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from rest_framework import serializers
 
+import constants
 from recipes.models import (Recipe, Tag, Ingredient,
                             RecipeIngredient, Favorite,
-                            ShoppingCart)
-from users.models import User, Follow
-from .utils import Base64ImageField
+                            ShoppingCart, ShoppingCartIngredient)
+from recipes.tasks import schedule_similar
+from users.models import User
+from .catalog import tag_catalog
+from .utils import Base64ImageField, get_followed_ids
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -21,11 +24,9 @@ class UserSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return (
-            user.is_authenticated
-            and obj.followed.filter(user=user).exists()
-        )
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.id in get_followed_ids(self.context.get('request'))
 
 
 class FollowSerializer(UserSerializer):
@@ -41,41 +42,23 @@ class FollowSerializer(UserSerializer):
         fields = ('email', 'id', 'username', 'first_name',
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
+    def get_is_subscribed(self, obj):
+        return True
+
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return author.recipes.count()
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         recipes = obj.recipes.all()
         recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
+        if recipes_limit and recipes_limit.isdigit():
             recipes = recipes[:int(recipes_limit)]
         return RecipeMiniSerializer(recipes, many=True).data
 
 
-class FollowUserSerializer(serializers.ModelSerializer):
-
-    """Serializer для модели Follow.
-    Всё о подписки пользователя,связанное с пользователями."""
-
-    class Meta:
-        model = Follow
-        fields = '__all__'
-
-    def validate(self, data):
-        user = self.context.get('request').user
-        result = user.follower.filter(author=data.follower).exists()
-        if result:
-            raise serializers.ValidationError(
-                'Вы уже подписаны на этого пользователя!'
-            )
-        if user == data.followed:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя!'
-            )
-        return data
-
-
 class RecipeMiniSerializer(serializers.ModelSerializer):
     """Сериализатор предназначен для вывода рецептом в FollowSerializer."""
     class Meta:
@@ -100,22 +83,9 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
         read_only_fields = '__all__',
 
-    def validate_tags(self, value):
-        tags = value
-        if not tags:
-            raise serializers.ValidationError(
-                'Нужен минимум один тег!'
-            )
-
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    'Теги не должны повторяться!'
-                )
-            tags_list.append(tag)
-
-        return value
+    def to_representation(self, instance):
+        return (tag_catalog.get(instance.id)
+                or super().to_representation(instance))
 
 
 class RecipeIngridientSerializer(serializers.ModelSerializer):
@@ -134,8 +104,7 @@ class RecipeIngridientSerializer(serializers.ModelSerializer):
 class AddIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления ингредиентов"""
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -160,19 +129,36 @@ class RecipeListSerializer(serializers.ModelSerializer):
                                              source='recipeingredients')
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
-                  'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time')
+                  'is_favorited', 'is_in_shopping_cart', 'favorites_count',
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return (user.is_authenticated
                 and user.favorites.filter(recipe=obj).exists())
 
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        storage = obj.image.storage
+        return {
+            variant: {
+                ext: request.build_absolute_uri(storage.url(name))
+                for ext, name in formats.items()
+            }
+            for variant, formats in obj.image_variants.items()
+            if variant != 'source'
+        }
+
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return (user.is_authenticated
                 and user.carts.filter(recipe=obj).exists())
@@ -181,10 +167,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления рецептов"""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = AddIngredientSerializer(many=True, write_only=True)
     image = Base64ImageField()
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
@@ -199,15 +182,27 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         if not ingredients:
             raise serializers.ValidationError(
                 {'ingredients': 'Нужно выбрать ингредиент!'})
-        ingredients_list = []
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, name=item['id'])
-            if ingredient in ingredients_list:
-                raise serializers.ValidationError(
-                    {'ingredients': 'Ингридиенты повторяются!'})
-            ingredients_list.append(ingredient)
+        ids = {item['id'] for item in ingredients}
+        if len(ids) != len(ingredients):
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингридиенты повторяются!'})
+        if Ingredient.objects.filter(id__in=ids).count() != len(ids):
+            raise serializers.ValidationError(
+                {'ingredients': 'Ингредиент не найден!'})
         return value
 
+    def validate_tags(self, value):
+        tags = value
+        if not tags:
+            raise serializers.ValidationError('Нужен минимум один тег!')
+        ids = set(tags)
+        if len(ids) != len(tags):
+            raise serializers.ValidationError('Теги не должны повторяться!')
+        tags = list(Tag.objects.filter(id__in=ids))
+        if len(tags) != len(ids):
+            raise serializers.ValidationError('Тег не найден!')
+        return tags
+
     def validate_cooking_time(self, value):
         cooking_time = value
         if not cooking_time:
@@ -219,30 +214,92 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.with_related(request.user).get(
+            pk=instance.pk)
         return RecipeListSerializer(instance, context=context).data
 
     @staticmethod
     def add_tags_ingredients(ingredients, tags, model):
-        for ingredient in ingredients:
-            RecipeIngredient.objects.update_or_create(
-                recipe=model,
-                ingredient=ingredient['id'],
-                amount=ingredient['amount'])
-        model.tags.set(tags)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=model,
+                             ingredient_id=ingredient['id'],
+                             amount=ingredient['amount'])
+            for ingredient in ingredients
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=model, tag=tag) for tag in tags
+        )
 
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        self.add_tags_ingredients(ingredients, tags, recipe)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            self.add_tags_ingredients(ingredients, tags, recipe)
+            schedule_similar(recipe)
         return recipe
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Приводит состав к ingredients; True, если он изменился."""
+        stored = {row.ingredient_id: row
+                  for row in recipe.recipeingredients.all()}
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        deltas = {
+            ingredient_id: amounts.get(ingredient_id, 0) - (
+                stored[ingredient_id].amount if ingredient_id in stored else 0
+            )
+            for ingredient_id in stored.keys() | amounts.keys()
+        }
+        changed = []
+        for ingredient_id, row in stored.items():
+            amount = amounts.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        removed = [row.id for ingredient_id, row in stored.items()
+                   if ingredient_id not in amounts]
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        added = RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in stored
+        )
+        ShoppingCartIngredient.objects.apply(
+            recipe.carts.values_list('user_id', flat=True), deltas)
+        return bool(removed or added)
+
+    @staticmethod
+    def update_tags(recipe, tags):
+        """Приводит теги к tags; True, если они изменились."""
+        stored = {tag.id for tag in recipe.tags.all()}
+        ids = {tag.id for tag in tags}
+        if stored - ids:
+            recipe.tags.remove(*(stored - ids))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag_id=tag_id)
+            for tag_id in ids - stored
+        )
+        return stored != ids
+
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.ingredients.clear()
-        self.add_tags_ingredients(ingredients, tags, instance)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        with transaction.atomic():
+            # Похожие рецепты зависят только от набора ингредиентов и тегов.
+            features_changed = False
+            if ingredients is not None:
+                features_changed |= self.update_ingredients(instance,
+                                                            ingredients)
+            if tags is not None:
+                features_changed |= self.update_tags(instance, tags)
+            if features_changed:
+                schedule_similar(instance)
+            return super().update(instance, validated_data)
 
 
 class FavoriteShoppingCartSerializer(serializers.ModelSerializer):
@@ -276,3 +333,24 @@ class ShoppingCartSerializer(FavoriteShoppingCartSerializer):
     class Meta:
         model = ShoppingCart
         fields = ('id', 'name', 'image', 'coocking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного добавления и удаления."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=constants.BATCH_MAX_SIZE
+    )
+
+    def validate_recipes(self, value):
+        recipe_ids = list(dict.fromkeys(value))
+        found = set(Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', flat=True))
+        missing = [recipe_id for recipe_id in recipe_ids
+                   if recipe_id not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Рецепты не найдены: {", ".join(map(str, missing))}')
+        return recipe_ids
@@ -1,33 +1,94 @@
+import csv
 import datetime
+import json
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
 from rest_framework import status
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.response import Response
 
-from recipes.models import RecipeIngredient
+
+SHOPPING_CART_RENDERERS = {}
+
+
+def shopping_cart_renderer(format, content_type):
+    """Регистрирует генератор списка покупок для формата файла."""
+    def decorator(func):
+        SHOPPING_CART_RENDERERS[format] = (func, content_type)
+        return func
+    return decorator
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу отдаёт записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+@shopping_cart_renderer('txt', 'text/plain; charset=utf-8')
+def render_txt(ingredients, today):
+    yield f'Список покупок на: {today}\n\n'
+    for name, measurement_unit, amount in ingredients:
+        yield f'{name} - {amount} {measurement_unit}\n'
+    yield f'\n\nFoodgram ({today})'
+
+
+@shopping_cart_renderer('csv', 'text/csv; charset=utf-8')
+def render_csv(ingredients, today):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for name, measurement_unit, amount in ingredients:
+        yield writer.writerow((name, amount, measurement_unit))
+
+
+@shopping_cart_renderer('json', 'application/json')
+def render_json(ingredients, today):
+    yield f'{{"date": "{today}", "ingredients": ['
+    separator = ''
+    for name, measurement_unit, amount in ingredients:
+        yield separator + json.dumps(
+            {'name': name,
+             'measurement_unit': measurement_unit,
+             'amount': amount},
+            ensure_ascii=False
+        )
+        separator = ', '
+    yield ']}'
+
+
+class ShoppingCartContentNegotiation(DefaultContentNegotiation):
+    """Параметр format выбирает формат файла, а не рендерер DRF."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
 
 
 def download_shopping_cart_(self, request):
     user = request.user
+    format = request.query_params.get('format', 'txt')
+    if format not in SHOPPING_CART_RENDERERS:
+        return Response(
+            {'errors': 'Доступные форматы: '
+                       + ', '.join(SHOPPING_CART_RENDERERS)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     if not user.carts.exists():
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__carts__user=request.user
-    ).values(
+    ingredients = user.cart_ingredients.values_list(
         'ingredient__name',
-        'ingredient__measurement_unit'
-    ).annotate(cart_amount=Sum('amount')).order_by('cart_amount')
+        'ingredient__measurement_unit',
+        'amount'
+    ).order_by('ingredient__name')
 
     today = datetime.datetime.now().strftime('%d-%m-%Y')
-    shopping_list = f'Список покупок на: {today}\n\n'
-    for ingredient in ingredients:
-        shopping_list += (
-            f'{ingredient["ingredient__name"]} - '
-            f'{ingredient["cart_amount"]} '
-            f'{ingredient["ingredient__measurement_unit"]}\n'
-        )
-    shopping_list += f'\n\nFoodgram ({today})'
-    response = FileResponse(shopping_list, content_type='text/plain')
+    render, content_type = SHOPPING_CART_RENDERERS[format]
+    response = StreamingHttpResponse(
+        render(ingredients.iterator(), today),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{format}"'
+    )
     return response
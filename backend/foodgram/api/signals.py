@@ -0,0 +1,58 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+from .authentication import token_cache
+from .cache import bump_version
+
+
+def recipe_responses_changed():
+    transaction.on_commit(lambda: bump_version('recipe_responses'))
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('ingredients'))
+    recipe_responses_changed()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tags_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('tags'))
+    recipe_responses_changed()
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipes_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('recipes'))
+    recipe_responses_changed()
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def recipe_ingredients_changed(sender, **kwargs):
+    recipe_responses_changed()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.discard(instance.key)
+    transaction.on_commit(lambda: bump_version(token_cache.version_name))
+
+
+@receiver(user_logged_out)
+def user_logged_out_everywhere(sender, user, **kwargs):
+    if user is not None:
+        token_cache.discard_user(user.pk)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """Смена пароля или деактивация сразу отзывают кешированные токены."""
+    token_cache.discard_user(instance.pk)
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        transaction.on_commit(
+            lambda: bump_version(token_cache.version_name))
@@ -0,0 +1,246 @@
+import base64
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connection
+from django.db.models.signals import pre_save
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            Tag)
+from users.models import User
+from .authentication import check_token_cache
+from .cache import bump_version
+from .catalog import ingredient_index, tag_catalog
+from .utils import Base64ImageField
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def other_process_cache():
+    """Свой экземпляр общего кеша, как у команды или другого воркера."""
+    return mock.patch('api.cache.cache', FileBasedCache(
+        settings.CACHES['default']['LOCATION'], {}))
+
+
+def bump_in_other_process(name):
+    with other_process_cache():
+        bump_version(name)
+
+
+def image_data():
+    buffer = BytesIO()
+    Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+class Base64ImageFieldTests(TestCase):
+
+    def test_wrapped_base64(self):
+        header, data = image_data().split(',')
+        wrapped = '\r\n'.join(
+            data[start:start + 76] for start in range(0, len(data), 76))
+        image = Base64ImageField().to_internal_value(
+            f'{header},\n{wrapped} \n')
+        self.assertEqual(image.read(), base64.b64decode(data))
+
+    def test_invalid_base64(self):
+        with self.assertRaisesMessage(ValidationError,
+                                      'Загрузите корректное изображение.'):
+            Base64ImageField().to_internal_value(
+                'data:image/png;base64,iVBOR*w0K')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeUpdateTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='password', first_name='Имя', last_name='Фамилия')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст',
+            cooking_time=10, image='recipes/temp.png')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=cls.recipe, ingredient=ingredient,
+                             amount=i + 1)
+            for i, ingredient in enumerate(cls.ingredients))
+        cls.recipe.tags.set([cls.tag])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user)}')
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def assert_no_ingredient_writes(self, method, data):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(
+                self.url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        writes = [
+            query['sql'] for query in context.captured_queries
+            if 'recipes_recipeingredient' in query['sql']
+            and query['sql'].lstrip().split()[0].upper()
+            in ('INSERT', 'UPDATE', 'DELETE')
+        ]
+        self.assertEqual(writes, [])
+
+    def test_patch_without_relations(self):
+        self.assert_no_ingredient_writes('patch', {'text': 'Новый текст'})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, 'Новый текст')
+
+    def test_put_with_same_relations(self):
+        self.assert_no_ingredient_writes('put', {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': i + 1}
+                for i, ingredient in enumerate(self.ingredients)
+            ],
+            'tags': [self.tag.id],
+            'image': image_data(),
+            'name': 'Рецепт',
+            'text': 'Другой текст',
+            'cooking_time': 15,
+        })
+        self.assertEqual(self.recipe.recipeingredients.count(), 3)
+
+    def test_patch_keeps_concurrent_favorite(self):
+        fan = User.objects.create_user(
+            username='fan', email='fan@example.com', password='password',
+            first_name='Имя', last_name='Фамилия')
+
+        def add_favorite(sender, instance, **kwargs):
+            # Рецепт уже загружен запросом, но ещё не сохранён.
+            Favorite.objects.add(fan, [instance.pk])
+
+        pre_save.connect(add_favorite, sender=Recipe)
+        self.addCleanup(pre_save.disconnect, add_favorite, sender=Recipe)
+        response = self.client.patch(
+            self.url, {'text': 'Новый текст'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.text, 'Новый текст')
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_stale_save_keeps_favorites_count(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.add(self.user, [recipe.pk])
+        recipe.name = 'Из админки'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+
+    def test_patch_changes_amount(self):
+        ingredients = [
+            {'id': ingredient.id, 'amount': 5}
+            for ingredient in self.ingredients
+        ]
+        response = self.client.patch(
+            self.url, {'ingredients': ingredients}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            set(self.recipe.recipeingredients.values_list(
+                'amount', flat=True)),
+            {5})
+
+
+class CatalogInvalidationTests(TestCase):
+    """Изменения из команд, shell и других воркеров видны всем процессам."""
+
+    def test_ingredient_index_rebuilds(self):
+        Ingredient.objects.create(name='Сахар', measurement_unit='г')
+        self.assertEqual(len(ingredient_index.search('сах')), 1)
+        # bulk_create не шлёт сигналов в этом процессе.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='Сахарная пудра', measurement_unit='г')])
+        bump_in_other_process('ingredients')
+        self.assertEqual(
+            [item['name'] for item in ingredient_index.search('сах')],
+            ['Сахар', 'Сахарная пудра'])
+
+    def test_tag_catalog_rebuilds(self):
+        tag = Tag.objects.create(
+            name='Обед', color='#49B64E', slug='lunch')
+        self.assertEqual(tag_catalog.ids(['lunch']), [tag.id])
+        Tag.objects.filter(pk=tag.pk).update(slug='dinner')
+        bump_in_other_process('tags')
+        self.assertEqual(tag_catalog.ids(['lunch']), [])
+        self.assertEqual(tag_catalog.ids(['dinner']), [tag.id])
+
+    def test_snapshot_follows_load_ingredients(self):
+        Ingredient.objects.create(name='Соль', measurement_unit='г')
+        first = self.client.get('/api/ingredients/')
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.csv', encoding='utf-8') as file:
+            file.write('Перец,г\n')
+            file.flush()
+            with other_process_cache():
+                call_command('load_ingredients', file.name,
+                             stdout=StringIO())
+        second = self.client.get('/api/ingredients/',
+                                 HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(
+            sorted(item['name'] for item in json.loads(second.content)),
+            ['Перец', 'Соль'])
+
+
+class TokenRevocationTests(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(
+            username='user', email='user@example.com', password='password',
+            first_name='Имя', last_name='Фамилия')
+        response = self.client.post(
+            '/api/auth/token/login/',
+            {'email': 'user@example.com', 'password': 'password'})
+        self.token = response.data['auth_token']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        # Токен попадает в кеш процесса.
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def test_logout(self):
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_revoked_in_other_process(self):
+        # Удаление без сигналов в этом процессе, как из другого воркера.
+        Token.objects.filter(key=self.token)._raw_delete('default')
+        bump_in_other_process('tokens')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_token_cache()
@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CustomUserViewSet
+from .views import CustomUserViewSet, metrics
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet
 
 
@@ -13,6 +13,7 @@ v1_router.register('recipes', RecipeViewSet, basename='recipes')
 v1_router.register('tags', TagViewSet, basename='tags')
 
 urlpatterns = [
+    path('metrics/', metrics, name='metrics'),
     path('', include(v1_router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
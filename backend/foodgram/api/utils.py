@@ -1,39 +1,105 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
 from rest_framework import serializers, status
 from rest_framework.response import Response
 
+import constants
+from .cache import bump_version
+
 
 class Base64ImageField(serializers.ImageField):
-    """Для работы с изображениями."""
+    """Для работы с изображениями.
+
+    Картинка из data URI декодируется частями во временный файл,
+    а размер и число пикселей проверяются до полной проверки Pillow.
+    """
+
+    chunk_size = 64 * 1024
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, 'temp.' + ext, format[len('data:'):])
+            self.close_with_request(data)
 
         return super().to_internal_value(data)
 
+    def close_with_request(self, file):
+        """Временный файл закроется и удалится вместе с файлами запроса."""
+        request = getattr(self.context.get('request'), '_request', None)
+        if request is not None:
+            request.FILES.appendlist(self.field_name, file)
+
+    def decode(self, imgstr, name, content_type):
+        # Клиенты переносят base64 по строкам; без пробелов куски
+        # делятся ровно по четыре символа.
+        imgstr = ''.join(imgstr.split())
+        size = len(imgstr) * 3 // 4
+        if size > constants.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Картинка не должна быть больше '
+                f'{constants.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ!'
+            )
+        file = TemporaryUploadedFile(name, content_type, size, None)
+        try:
+            for start in range(0, len(imgstr), self.chunk_size):
+                file.write(base64.b64decode(
+                    imgstr[start:start + self.chunk_size], validate=True))
+            file.size = file.tell()
+            file.seek(0)
+            with Image.open(file) as image:
+                width, height = image.size
+        except (binascii.Error, ValueError, OSError):
+            file.close()
+            raise serializers.ValidationError(
+                'Загрузите корректное изображение.')
+        if width * height > constants.RECIPE_IMAGE_MAX_PIXELS:
+            file.close()
+            raise serializers.ValidationError(
+                'Слишком большое разрешение картинки!')
+        file.seek(0)
+        return file
+
+
+def get_followed_ids(request):
+    """id авторов, на которых подписан пользователь, один раз за запрос."""
+    if not hasattr(request, 'followed_ids'):
+        user = request.user
+        request.followed_ids = set(
+            user.follower.values_list('author_id', flat=True)
+        ) if user.is_authenticated else set()
+    return request.followed_ids
+
 
 def post_delete_method(self, request, recipe, serializer_name, model_name):
-    user = self.request.user
+    user = request.user
     if request.method == 'POST':
-        if model_name.objects.filter(user=user,
-                                     recipe=recipe).exists():
+        if not model_name.objects.add(user, [recipe.pk]):
             return Response({'errors': 'Рецепт уже добавлен!'},
                             status=status.HTTP_400_BAD_REQUEST)
-        serializer = serializer_name(data=request.data)
-        if serializer.is_valid(raise_exception=True):
-            serializer.save(user=user, recipe=recipe)
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        return Response(serializer.errors,
-                        status=status.HTTP_400_BAD_REQUEST)
-    if not model_name.objects.filter(user=user,
-                                     recipe=recipe).exists():
+        bump_version(f'recipes:{user.id}')
+        serializer = serializer_name(model_name(user=user, recipe=recipe))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    if not model_name.objects.remove(user, [recipe.pk]):
         return Response({'errors': 'Объект не найден'},
                         status=status.HTTP_400_BAD_REQUEST)
-    model_name.objects.get(recipe=recipe).delete()
+    bump_version(f'recipes:{user.id}')
     return Response('Рецепт успешно удалён.',
                     status=status.HTTP_204_NO_CONTENT)
+
+
+def batch_method(self, request, serializer_name, model_name):
+    user = request.user
+    serializer = serializer_name(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    recipe_ids = serializer.validated_data['recipes']
+    if request.method == 'POST':
+        result = {'added': model_name.objects.add(user, recipe_ids)}
+    else:
+        result = {'removed': model_name.objects.remove(user, recipe_ids)}
+    bump_version(f'recipes:{user.id}')
+    return Response(result, status=status.HTTP_200_OK)
@@ -1,24 +1,36 @@
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
-from rest_framework.permissions import (AllowAny, IsAuthenticated,
-                                        SAFE_METHODS)
+from rest_framework.decorators import (action, api_view,
+                                       permission_classes)
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated, SAFE_METHODS)
 from rest_framework.response import Response
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import CustomPagination
+import constants
+from foodgram.db import database_stats, insert_ignore
+from .authentication import token_cache
+from .cache import AnonymousResponseCacheMixin
+from .catalog import ingredient_index, ingredient_snapshot, tag_catalog
+from .filters import RecipeFilter
+from .pagination import CustomPagination, FeedPagination
 from .permissions import IsAdminAuthorOrReadOnly
-from recipes.models import (Favorite, Ingredient, Recipe,
-                            ShoppingCart, Tag)
-from .services import download_shopping_cart_
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            ShoppingCart, SimilarRecipe, Tag)
+from .services import (download_shopping_cart_,
+                       ShoppingCartContentNegotiation)
 from .serializers import (FavoriteSerializer, IngredientSerializer,
                           RecipeWriteSerializer, RecipeListSerializer,
                           ShoppingCartSerializer, TagSerializer,
-                          FollowSerializer, UserSerializer)
+                          FollowSerializer, RecipeIdsSerializer,
+                          UserSerializer)
 from users.models import User, Follow
-from .utils import post_delete_method
+from .utils import batch_method, post_delete_method
 
 
 class CustomUserViewSet(UserViewSet):
@@ -29,32 +41,79 @@ class CustomUserViewSet(UserViewSet):
     serializer_class = UserSerializer
     pagination_class = CustomPagination
 
+    def get_queryset(self):
+        return super().get_queryset().with_is_subscribed(self.request.user)
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, *args, **kwargs):
-        author = get_object_or_404(User, id=self.kwargs.get('id'))
+        user = request.user
+        author_id = self.kwargs.get('id')
         if request.method == 'POST':
-            Follow.objects.create(user=request.user, author=author)
+            author = get_object_or_404(User, id=author_id)
+            if author == user:
+                return Response({'errors': 'Нельзя подписаться на себя!'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            with transaction.atomic():
+                if not insert_ignore(Follow, ('user', 'author'),
+                                     [(user.id, author.id)]):
+                    return Response(
+                        {'errors': 'Вы уже подписаны на этого пользователя'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                FeedEntry.objects.backfill(user, author)
+            author.is_subscribed = True
             return Response(
                 self.serializer_class(author,
                                       context={'request': request}).data,
                 status=status.HTTP_201_CREATED
             )
 
-        if Follow.objects.filter(user=request.user, author=author).exists():
-            Follow.objects.get(user=request.user, author=author).delete()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                user=user, author_id=author_id).delete()
+            if deleted:
+                FeedEntry.objects.remove(user, author_id)
+        if deleted:
             return Response('Отписка прошла успешно',
                             status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=author_id)
         return Response({'errors': 'Вы не подписаны на этого пользователя'},
                         status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def subscription_status(self, request):
+        ids = request.query_params.get('ids', '').split(',')
+        if not all(author_id.isdigit() for author_id in ids) or (
+                len(ids) > constants.BATCH_MAX_SIZE):
+            return Response(
+                {'errors': 'Передайте в ids до '
+                           f'{constants.BATCH_MAX_SIZE} id через запятую'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ids = [int(author_id) for author_id in ids]
+        followed = set(request.user.follower.filter(
+            author_id__in=ids).values_list('author_id', flat=True))
+        return Response({author_id: author_id in followed
+                         for author_id in ids})
+
     @action(detail=False,
             methods=['get'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(followed__user=user)
+        recipes = Recipe.objects.filter(author__followed__user=user)
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.first_per_author(int(recipes_limit))
+        queryset = User.objects.filter(followed__user=user).annotate(
+            recipes_count=Count('recipes')
+        ).order_by('username').prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        )
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             pages,
@@ -72,6 +131,16 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     serializer_class = TagSerializer
 
+    def list(self, request, *args, **kwargs):
+        return tag_catalog.response(request)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs.get('pk')
+        tag = tag_catalog.get(int(pk)) if pk.isdigit() else None
+        if tag is None:
+            raise Http404
+        return Response(tag)
+
 
 class IngredientViewSet(viewsets.ModelViewSet):
 
@@ -80,21 +149,29 @@ class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = IngredientSerializer
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientSearchFilter
-    search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return ingredient_snapshot.response(request)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
 
     """Вьюсет для работы с рецептами."""
 
-    queryset = Recipe.objects.all().select_related(
-        'author').prefetch_related('tags')
+    queryset = Recipe.objects.all()
     permission_classes = (IsAdminAuthorOrReadOnly, )
-    filter_backends = (DjangoFilterBackend, )
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
     pagination_class = CustomPagination
     filterset_class = RecipeFilter
+    ordering_fields = ('name', 'favorites_count')
+    count_cache_version = 'recipes'
+    response_cache_version = 'recipe_responses'
+
+    def get_queryset(self):
+        return super().get_queryset().with_related(self.request.user)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -123,11 +200,82 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return post_delete_method(self, request, recipe,
                                   ShoppingCartSerializer, ShoppingCart)
 
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated, ],
+            url_path='favorite/batch')
+    def favorite_batch(self, request):
+
+        """Добавление в избранное и удаление из него сразу многих рецептов."""
+
+        return batch_method(self, request, RecipeIdsSerializer, Favorite)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            permission_classes=[IsAuthenticated, ],
+            url_path='shopping_cart/batch')
+    def shopping_cart_batch(self, request):
+
+        """Добавление в список покупок и удаление из него многих рецептов."""
+
+        return batch_method(self, request, RecipeIdsSerializer, ShoppingCart)
+
     @action(detail=False,
             methods=['get'],
-            permission_classes=[IsAuthenticated, ])
+            permission_classes=[IsAuthenticated, ],
+            content_negotiation_class=ShoppingCartContentNegotiation)
     def download_shopping_cart(self, request):
 
         """ Для скачивания списка покупок. """
 
         return download_shopping_cart_(self, request)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+
+        """Самые похожие по ингредиентам и тегам рецепты."""
+
+        recipe = get_object_or_404(Recipe, id=pk)
+        similar_ids = list(SimilarRecipe.objects.filter(
+            recipe=recipe
+        ).order_by('-score', 'similar_id').values_list(
+            'similar_id', flat=True
+        )[:constants.SIMILAR_RECIPES_COUNT])
+        recipes = self.get_queryset().in_bulk(similar_ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in similar_ids
+             if recipe_id in recipes],
+            many=True
+        )
+        return Response(serializer.data)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[IsAuthenticated, ],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+
+        """Последние рецепты авторов, на которых подписан пользователь."""
+
+        entries = self.paginate_queryset(
+            request.user.feed_entries.only('recipe_id')
+        )
+        recipes = self.get_queryset().in_bulk(
+            [entry.recipe_id for entry in entries]
+        )
+        serializer = self.get_serializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+
+    """Счётчики кешей и соединений процесса, обработавшего запрос."""
+
+    return Response({'token_cache': token_cache.stats(),
+                     'database': database_stats()})
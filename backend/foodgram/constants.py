@@ -10,3 +10,23 @@ LENGTH_USER_EMAIL = 256
 LENGTH_USER_FIRST_NAME = 50
 LENGTH_USER_LAST_NAME = 100
 PAGE_SIZE = 6
+COUNT_CACHE_TIMEOUT = 5 * 60
+COUNT_ESTIMATE_THRESHOLD = 100_000
+RESPONSE_CACHE_TIMEOUT = 10 * 60
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 4096 * 4096
+RECIPE_IMAGE_VARIANTS = {
+    'list': (400, 400),
+    'card': (800, 800),
+    'detail': (1280, 1280),
+}
+RECIPE_IMAGE_WORKERS = 2
+FEED_MAX_LENGTH = 500
+FEED_BATCH_SIZE = 1000
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_RECIPES_BATCH_SIZE = 1000
+SIMILAR_RECIPES_WORKERS = 1
+BATCH_MAX_SIZE = 100
+TOKEN_CACHE_SIZE = 10_000
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_NEGATIVE_TTL = 10
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+class FoodgramConfig(AppConfig):
+    name = 'foodgram'
+
+    def ready(self):
+        from foodgram.db import check_connections
+        request_started.connect(check_connections,
+                                dispatch_uid='foodgram_check_connections')
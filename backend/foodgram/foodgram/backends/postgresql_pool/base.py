@@ -0,0 +1,153 @@
+"""PostgreSQL с пулом соединений внутри процесса.
+
+Подходит для gunicorn с потоками (gthread): соединение берётся из пула
+при подключении и возвращается в него при закрытии, поэтому вместе
+с CONN_MAX_AGE = 0 установка соединения не попадает в каждый запрос.
+Размеры пула задаются в DATABASES[...]['POOL'].
+"""
+import threading
+import time
+
+import psycopg2.extras
+from django.conf import settings
+from django.db.backends.postgresql import base, creation
+from django.utils.asyncio import async_unsafe
+from psycopg2.pool import ThreadedConnectionPool
+
+from foodgram.db import pools
+
+Database = base.Database
+
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """ThreadedConnectionPool с ожиданием свободного соединения."""
+
+    def __init__(self, conn_params, min_size=1, max_size=10, timeout=10):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._pool = ThreadedConnectionPool(min_size, max_size, **conn_params)
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.checkouts = self.reconnects = self.timeouts = 0
+        self.wait_total = self.wait_max = 0.0
+
+    @staticmethod
+    def is_alive(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except Database.Error:
+            return False
+        return True
+
+    def checkout(self, health_check=True):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            self.timeouts += 1
+            raise Database.OperationalError(
+                f'Нет свободного соединения в пуле за {self.timeout} с.')
+        waited = time.monotonic() - started
+        try:
+            # Мёртвые соединения выбрасываются, пока не найдётся живое
+            # или пока не кончатся свободные: тогда пул откроет новое.
+            while True:
+                reused = bool(self._pool._pool)
+                connection = self._pool.getconn()
+                if not (health_check and reused) or self.is_alive(connection):
+                    break
+                self._pool.putconn(connection, close=True)
+                self.reconnects += 1
+        except Exception:
+            self._slots.release()
+            raise
+        self.checkouts += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return connection
+
+    def checkin(self, connection):
+        try:
+            self._pool.putconn(connection, close=bool(connection.closed))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        self._pool.closeall()
+
+    def stats(self):
+        return {
+            'max_size': self.max_size,
+            'open': len(self._pool._pool) + len(self._pool._used),
+            'in_use': len(self._pool._used),
+            'checkouts': self.checkouts,
+            'wait_avg': (self.wait_total / self.checkouts
+                         if self.checkouts else 0.0),
+            'wait_max': self.wait_max,
+            'reconnects': self.reconnects,
+            'timeouts': self.timeouts,
+        }
+
+
+def close_pool(name):
+    with _pools_lock:
+        pool = pools.pop(name, None)
+    if pool is not None:
+        pool.close()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Соединения пула к тестовой базе не дали бы её удалить.
+        close_pool(self.connection.pool_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    @property
+    def pool_name(self):
+        return f'{self.alias}:{self.settings_dict["NAME"]}'
+
+    def get_pool(self, conn_params):
+        with _pools_lock:
+            pool = pools.get(self.pool_name)
+            if pool is None:
+                options = self.settings_dict.get('POOL', {})
+                pool = pools[self.pool_name] = ConnectionPool(
+                    conn_params,
+                    min_size=options.get('MIN_SIZE', 1),
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10),
+                )
+        return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.checkout(
+            health_check=settings.DATABASE_HEALTH_CHECKS)
+        # Как в django.db.backends.postgresql, но соединение из пула.
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection,
+                                               loads=lambda x: x)
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
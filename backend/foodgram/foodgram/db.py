@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+pools = {}
+connection_stats = {'health_checks': 0, 'reconnects': 0}
+
+
+def insert_ignore(model, fields, rows, using=DEFAULT_DB_ALIAS):
+    """Вставляет строки rows, пропуская нарушающие уникальность.
+
+    rows — кортежи значений полей fields. Возвращает строки, которые
+    действительно вставлены. Где база умеет RETURNING, хватает одного
+    запроса, иначе каждая строка вставляется отдельно.
+    """
+    connection = connections[using]
+    ops = connection.ops
+    columns = ', '.join(ops.quote_name(model._meta.get_field(field).column)
+                        for field in fields)
+    placeholder = '({})'.format(', '.join(['%s'] * len(fields)))
+    sql = (
+        f'{ops.insert_statement(ignore_conflicts=True)} '
+        f'{ops.quote_name(model._meta.db_table)} ({columns}) '
+        f'VALUES {{}} {ops.ignore_conflicts_suffix_sql(True)}'
+    )
+    rows = [tuple(row) for row in rows]
+    if not rows:
+        return []
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            cursor.execute(
+                sql.format(', '.join([placeholder] * len(rows)))
+                + f' RETURNING {columns}',
+                [value for row in rows for value in row]
+            )
+            return [tuple(row) for row in cursor.fetchall()]
+        inserted = []
+        for row in rows:
+            cursor.execute(sql.format(placeholder), row)
+            if cursor.rowcount:
+                inserted.append(row)
+        return inserted
+
+
+def delete_returning(model, lookups, returning, using=DEFAULT_DB_ALIAS):
+    """Удаляет строки одним запросом DELETE ... RETURNING.
+
+    lookups — {поле: значение или список значений}. Возвращает значения
+    поля returning у действительно удалённых строк. Сигналы удаления
+    не отправляются. Нужна база с DELETE ... RETURNING (PostgreSQL).
+    """
+    connection = connections[using]
+    ops = connection.ops
+    conditions, params = [], []
+    for field, value in lookups.items():
+        column = ops.quote_name(model._meta.get_field(field).column)
+        if isinstance(value, (list, tuple)):
+            if not value:
+                return []
+            conditions.append('{} IN ({})'.format(
+                column, ', '.join(['%s'] * len(value))))
+            params.extend(value)
+        else:
+            conditions.append(f'{column} = %s')
+            params.append(value)
+    sql = (
+        f'DELETE FROM {ops.quote_name(model._meta.db_table)} '
+        f'WHERE {" AND ".join(conditions)} RETURNING '
+        f'{ops.quote_name(model._meta.get_field(returning).column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def check_connections(**kwargs):
+    """Закрывает сохранённые с прошлых запросов неживые соединения."""
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        connection_stats['health_checks'] += 1
+        if not connection.is_usable():
+            connection.close()
+            connection_stats['reconnects'] += 1
+
+
+def database_stats():
+    return {
+        'connections': dict(connection_stats),
+        'pools': {name: pool.stats() for name, pool in pools.items()},
+    }
@@ -1,4 +1,6 @@
 import os
+import sys
+import tempfile
 
 from pathlib import Path
 
@@ -38,6 +40,7 @@ INSTALLED_APPS = [
     'recipes.apps.RecipesConfig',
     'api.apps.ApiConfig',
     'django_filters',
+    'foodgram.apps.FoodgramConfig',
 ]
 
 MIDDLEWARE = [
@@ -77,12 +80,20 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('POSTGRE_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'django'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # С DB_ENGINE=foodgram.backends.postgresql_pool ставьте 0:
+        # соединения будут возвращаться в пул после каждого запроса.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        },
     },
     'local_db': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -90,6 +101,33 @@ DATABASES = {
     }
 }
 
+if 'test' in sys.argv:
+    DATABASES['default'] = dict(DATABASES['local_db'])
+
+DATABASE_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', 'True') == 'True'
+
+# Версии кешей должны быть видны всем процессам: воркерам gunicorn
+# и командам manage.py. Файловый кеш общий в пределах контейнера,
+# для нескольких контейнеров нужен memcached или другой общий кеш.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
+if 'test' in sys.argv:
+    CACHES['default']['LOCATION'] = tempfile.mkdtemp(prefix='foodgram-cache-')
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -145,7 +183,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
@@ -0,0 +1,139 @@
+from unittest import mock
+
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from psycopg2.pool import ThreadedConnectionPool
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram.backends.postgresql_pool.base import ConnectionPool
+from foodgram.db import check_connections, connection_stats, database_stats
+from users.models import User
+
+
+class CheckConnectionsTests(TransactionTestCase):
+    # TestCase держит соединение в atomic, а такие проверка пропускает.
+    databases = {'local_db'}
+
+    def setUp(self):
+        self.connection = connections['local_db']
+        self.connection.ensure_connection()
+        mock.patch.object(connections, 'all',
+                          return_value=[self.connection]).start()
+        self.addCleanup(mock.patch.stopall)
+        self.before = dict(connection_stats)
+
+    def delta(self, name):
+        return connection_stats[name] - self.before[name]
+
+    def test_live_connection_is_kept(self):
+        raw = self.connection.connection
+        check_connections()
+        self.assertEqual(self.delta('health_checks'), 1)
+        self.assertEqual(self.delta('reconnects'), 0)
+        self.assertIs(self.connection.connection, raw)
+
+    def test_dead_connection_is_closed(self):
+        with mock.patch.object(self.connection, 'is_usable',
+                               return_value=False):
+            with mock.patch.object(self.connection, 'close') as close:
+                check_connections()
+        self.assertEqual(self.delta('health_checks'), 1)
+        self.assertEqual(self.delta('reconnects'), 1)
+        close.assert_called_once_with()
+
+    def test_closed_connection_is_skipped(self):
+        with mock.patch.object(self.connection, 'connection', None):
+            check_connections()
+        self.assertEqual(self.delta('health_checks'), 0)
+
+    def test_atomic_block_is_skipped(self):
+        with mock.patch.object(self.connection, 'in_atomic_block', True):
+            check_connections()
+        self.assertEqual(self.delta('health_checks'), 0)
+
+    @override_settings(DATABASE_HEALTH_CHECKS=False)
+    def test_disabled(self):
+        check_connections()
+        self.assertEqual(self.delta('health_checks'), 0)
+
+    def test_database_stats(self):
+        with mock.patch.object(self.connection, 'is_usable',
+                               return_value=False):
+            check_connections()
+        pool = mock.Mock(**{'stats.return_value': {'in_use': 1}})
+        with mock.patch.dict('foodgram.db.pools', {'default:test': pool}):
+            stats = database_stats()
+        self.assertEqual(stats['connections'], connection_stats)
+        self.assertEqual(stats['pools'], {'default:test': {'in_use': 1}})
+
+
+class ConnectionPoolTests(TestCase):
+
+    def setUp(self):
+        self.opened = []
+        mock.patch.object(ThreadedConnectionPool, '_connect', autospec=True,
+                          side_effect=self.connect).start()
+        self.addCleanup(mock.patch.stopall)
+        self.pool = ConnectionPool({}, min_size=3, max_size=4)
+
+    def connect(self, pool, key=None):
+        connection = mock.MagicMock(closed=0, autocommit=True)
+        self.opened.append(connection)
+        if key is not None:
+            pool._used[key] = connection
+            pool._rused[id(connection)] = key
+        else:
+            pool._pool.append(connection)
+        return connection
+
+    def kill(self, count):
+        # Свободные соединения выдаются с конца списка.
+        for connection in self.pool._pool._pool[-count:]:
+            connection.closed = 1
+
+    def test_skips_all_dead_connections(self):
+        self.kill(2)
+        connection = self.pool.checkout()
+        self.assertIs(connection, self.opened[0])
+        self.assertEqual(self.pool.reconnects, 2)
+
+    def test_opens_new_connection_when_drained(self):
+        self.kill(3)
+        connection = self.pool.checkout()
+        self.assertIs(connection, self.opened[3])
+        self.assertEqual(self.pool.reconnects, 3)
+        self.assertEqual(self.pool.stats()['open'], 1)
+
+    def test_health_check_disabled(self):
+        self.kill(1)
+        self.assertIs(self.pool.checkout(health_check=False),
+                      self.opened[2])
+        self.assertEqual(self.pool.reconnects, 0)
+
+
+class MetricsTests(TestCase):
+    url = '/api/metrics/'
+
+    def client_for(self, **fields):
+        user = User.objects.create_user(
+            username='user', email='user@example.com', password='password',
+            first_name='Имя', last_name='Фамилия', **fields)
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user)}')
+        return client
+
+    def test_admin_gets_stats(self):
+        response = self.client_for(is_staff=True).get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['database'], database_stats())
+        self.assertIn('hit_rate', response.data['token_cache'])
+
+    def test_user_is_forbidden(self):
+        response = self.client_for().get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_anonymous_is_unauthorized(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
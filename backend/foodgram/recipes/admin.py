@@ -3,8 +3,9 @@ from django.contrib import admin
 from django.forms.models import BaseInlineFormSet
 from django.forms import ValidationError
 
-from recipes.models import (Favorite, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag)
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart,
+                            ShoppingCartIngredient, SimilarRecipe, Tag)
 
 
 @admin.register(Tag)
@@ -41,7 +42,7 @@ class RecipeIngredientInline(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'favorites_amount')
+    list_display = ('id', 'name', 'author', 'favorites_count')
     search_fields = ('name', 'author')
     list_filter = ('name', 'author', 'tags')
     filter_horizontal = ('ingredients',)
@@ -50,10 +51,6 @@ class RecipeAdmin(admin.ModelAdmin):
     save_as = True
     min_num = 1
 
-    @staticmethod
-    def favorites_amount(obj):
-        return obj.favorites.count()
-
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
@@ -75,3 +72,24 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
     search_fields = ('user', 'recipe')
     empty_value_display = settings.EMPTY_VALUE
+
+
+@admin.register(ShoppingCartIngredient)
+class ShoppingCartIngredientAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    search_fields = ('user__username', 'ingredient__name')
+    empty_value_display = settings.EMPTY_VALUE
+
+
+@admin.register(FeedEntry)
+class FeedEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'author', 'recipe')
+    search_fields = ('user__username', 'author__username', 'recipe__name')
+    empty_value_display = settings.EMPTY_VALUE
+
+
+@admin.register(SimilarRecipe)
+class SimilarRecipeAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'similar', 'score')
+    search_fields = ('recipe__name',)
+    empty_value_display = settings.EMPTY_VALUE
@@ -0,0 +1,63 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, features
+
+import constants
+
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=constants.RECIPE_IMAGE_WORKERS,
+                              thread_name_prefix='recipe-images')
+
+FORMATS = {'jpeg': 'JPEG'}
+if features.check('webp'):
+    FORMATS['webp'] = 'WEBP'
+
+
+def render_variants(field):
+    """Уменьшенные копии картинки рецепта во всех форматах."""
+    variants = {'source': field.name}
+    with field.storage.open(field.name) as file, Image.open(file) as image:
+        image = image.convert('RGB')
+        for variant, size in constants.RECIPE_IMAGE_VARIANTS.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail(size)
+            variants[variant] = {}
+            for ext, format in FORMATS.items():
+                buffer = BytesIO()
+                thumbnail.save(buffer, format, quality=85)
+                variants[variant][ext] = field.storage.save(
+                    f'recipes/variants/{variant}.{ext}',
+                    ContentFile(buffer.getvalue())
+                )
+    return variants
+
+
+def generate_variants(recipe_id):
+    from api.cache import bump_version
+    from recipes.models import Recipe
+
+    try:
+        recipe = Recipe.objects.only('image').get(pk=recipe_id)
+        variants = render_variants(recipe.image)
+        if Recipe.objects.filter(
+            pk=recipe_id, image=variants['source']
+        ).update(image_variants=variants):
+            bump_version('recipe_responses')
+    except Exception:
+        logger.exception('Не удалось подготовить картинки рецепта %s',
+                         recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_variants(recipe):
+    """Готовит копии картинки в фоне после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: executor.submit(generate_variants, recipe.pk)
+    )
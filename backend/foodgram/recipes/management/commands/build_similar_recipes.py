@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import SimilarRecipe
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает таблицу похожих рецептов.'
+
+    def handle(self, *args, **options):
+        SimilarRecipe.objects.rebuild()
+        self.stdout.write(
+            f'Сохранено пар похожих рецептов: '
+            f'{SimilarRecipe.objects.count()}.'
+        )
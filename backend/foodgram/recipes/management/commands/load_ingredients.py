@@ -1,30 +1,86 @@
 import csv
+import json
 import os
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_version
 from recipes.models import Ingredient
 
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
 
 
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла в папке data.'
 
     def add_arguments(self, parser):
-        parser.add_argument('path', default='ingredients.csv',
+        parser.add_argument('path', nargs='?', default='ingredients.csv',
                             type=str, help='Путь к файлу с данными.')
+        parser.add_argument('--batch-size', default=1000, type=int,
+                            help='Сколько строк вставлять за один запрос.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Посчитать результат и откатить загрузку.')
 
     def handle(self, *args, **options):
+        path = os.path.join(DATA_ROOT, options['path'])
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Размер пачки должен быть больше нуля.')
+
         self.stdout.write('Началась загрузка ингредиентов')
-        with open(os.path.join(DATA_ROOT, options['path']), newline='',
-                  encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                name, measurement_unit = row
-                Ingredient.objects.update_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
-                )
-        self.stdout.write('Загрузка ингредиентов завершена.')
+        processed = 0
+        with open(path, newline='', encoding='utf-8') as f:
+            with transaction.atomic():
+                existing = Ingredient.objects.count()
+                rows = reader(f)
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    Ingredient.objects.bulk_create(
+                        (Ingredient(name=name,
+                                    measurement_unit=measurement_unit)
+                         for name, measurement_unit in batch),
+                        ignore_conflicts=True
+                    )
+                    processed += len(batch)
+                    self.stdout.write(f'Обработано строк: {processed}')
+                inserted = Ingredient.objects.count() - existing
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+
+        if inserted and not options['dry_run']:
+            bump_version('ingredients')
+        self.stdout.write(
+            f'Добавлено ингредиентов: {inserted}, '
+            f'уже были в базе: {processed - inserted}.'
+        )
+        if options['dry_run']:
+            self.stdout.write('Пробный запуск: изменения отменены.')
+        else:
+            self.stdout.write('Загрузка ингредиентов завершена.')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import render_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии картинок, которых ещё нет.'
+
+    def handle(self, *args, **options):
+        prepared = 0
+        for recipe in Recipe.objects.only('image', 'image_variants'):
+            if (not recipe.image or recipe.image_variants.get('source')
+                    == recipe.image.name):
+                continue
+            Recipe.objects.filter(pk=recipe.pk).update(
+                image_variants=render_variants(recipe.image))
+            prepared += 1
+        self.stdout.write(f'Подготовлено картинок: {prepared}.')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и пересобирает суммы ингредиентов в списках покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить суммы, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        expected = ShoppingCartIngredient.objects.expected()
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount')
+        }
+        mismatched = {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+        user_ids = {user_id for user_id, _ in mismatched}
+        self.stdout.write(f'Строк с расхождениями: {len(mismatched)}, '
+                          f'пользователей: {len(user_ids)}.')
+        if options['check']:
+            if mismatched:
+                raise CommandError('Суммы в списках покупок расходятся.')
+            return
+        if user_ids:
+            ShoppingCartIngredient.objects.rebuild(user_ids)
+        self.stdout.write('Списки покупок пересобраны.')
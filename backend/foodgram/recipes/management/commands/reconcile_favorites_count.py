@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+
+
+class Command(BaseCommand):
+    help = 'Сверяет и исправляет число добавлений рецептов в избранное.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только проверить счётчики, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        actual = Coalesce(Subquery(
+            Favorite.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe').annotate(total=Count('id')).values('total')
+        ), 0)
+        drifted = Recipe.objects.annotate(actual=actual).exclude(
+            favorites_count=F('actual'))
+        count = drifted.count()
+        self.stdout.write(f'Рецептов с расхождениями: {count}.')
+        if options['check']:
+            if count:
+                raise CommandError('Счётчики избранного расходятся.')
+            return
+        if count:
+            Recipe.objects.filter(
+                pk__in=list(drifted.values_list('pk', flat=True))
+            ).update(favorites_count=actual)
+        self.stdout.write('Счётчики избранного исправлены.')
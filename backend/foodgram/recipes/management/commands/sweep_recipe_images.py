@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.storage import recipe_image_storage
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки рецептов, на которые больше никто не ссылается.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', default=3600, type=int,
+                            help='Не трогать файлы моложе стольких секунд.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+
+    def handle(self, *args, **options):
+        storage = recipe_image_storage
+        deadline = timezone.now() - timedelta(seconds=options['min_age'])
+        referenced = storage.referenced()
+        removed = 0
+        for name in storage.walk('recipes'):
+            if (name in referenced
+                    or storage.get_modified_time(name) > deadline):
+                continue
+            self.stdout.write(f'Удаляется {name}')
+            if not options['dry_run']:
+                storage.delete(name)
+            removed += 1
+        self.stdout.write(f'Удалено файлов: {removed}.')
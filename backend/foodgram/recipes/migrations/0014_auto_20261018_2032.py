@@ -0,0 +1,54 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:32
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_cart_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartIngredient = apps.get_model('recipes',
+                                            'ShoppingCartIngredient')
+    totals = RecipeIngredient.objects.filter(
+        recipe__carts__isnull=False
+    ).values_list(
+        'recipe__carts__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        ShoppingCartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                               amount=amount)
+        for user_id, ingredient_id, amount in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0013_auto_20231011_1633'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество ингредиента')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списке покупок',
+                'ordering': ['user'],
+                'default_related_name': 'cart_ingredients',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_user_cart_ingredient'),
+        ),
+        migrations.RunPython(fill_cart_ingredients,
+                             migrations.RunPython.noop),
+    ]
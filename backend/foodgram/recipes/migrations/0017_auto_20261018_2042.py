@@ -0,0 +1,58 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+FEED_MAX_LENGTH = 500
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    for user_id in Follow.objects.values_list(
+            'user_id', flat=True).distinct().order_by():
+        recipes = Recipe.objects.filter(
+            author__followed__user_id=user_id
+        ).order_by('-id').values_list('id', 'author_id')[:FEED_MAX_LENGTH]
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user_id=user_id, author_id=author_id,
+                      recipe_id=recipe_id)
+            for recipe_id, author_id in recipes
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0016_alter_recipe_image'),
+        ('users', '0002_alter_follow_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+                'ordering': ['user'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'author'], name='feed_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_feed_recipe'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
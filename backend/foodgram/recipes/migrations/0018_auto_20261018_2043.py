@@ -0,0 +1,35 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:43
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_favorites_count(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(favorites_count=Coalesce(Subquery(
+        Favorite.objects.filter(recipe=OuterRef('pk')).order_by().values(
+            'recipe').annotate(total=Count('id')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_auto_20261018_2042'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', 'id'], name='recipe_popularity_idx'),
+        ),
+        migrations.RunPython(fill_favorites_count,
+                             migrations.RunPython.noop),
+    ]
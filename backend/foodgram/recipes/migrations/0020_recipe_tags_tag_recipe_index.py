@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_auto_20261018_2045'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id);',
+            'DROP INDEX IF EXISTS recipes_recipe_tags_tag_recipe_idx;',
+        ),
+    ]
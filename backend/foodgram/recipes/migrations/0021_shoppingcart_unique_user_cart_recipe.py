@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def remove_duplicate_carts(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartIngredient = apps.get_model('recipes',
+                                            'ShoppingCartIngredient')
+    duplicates = ShoppingCart.objects.values('user_id', 'recipe_id').annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1).order_by()
+    user_ids = set()
+    for row in duplicates:
+        ShoppingCart.objects.filter(
+            user_id=row['user_id'], recipe_id=row['recipe_id']
+        ).exclude(id=row['first_id']).delete()
+        user_ids.add(row['user_id'])
+    if not user_ids:
+        return
+    ShoppingCartIngredient.objects.filter(user_id__in=user_ids).delete()
+    totals = RecipeIngredient.objects.filter(
+        recipe__carts__user_id__in=user_ids
+    ).values_list(
+        'recipe__carts__user_id', 'ingredient_id'
+    ).annotate(total=Sum('amount')).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        ShoppingCartIngredient(user_id=user_id, ingredient_id=ingredient_id,
+                               amount=amount)
+        for user_id, ingredient_id, amount in totals
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_carts,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_user_cart_recipe'),
+        ),
+    ]
@@ -1,10 +1,19 @@
+from collections import defaultdict
+
 from django.core.validators import (RegexValidator,
                                     MinValueValidator,
                                     MaxValueValidator)
-from django.db import models
+from django.db import connection, connections, models, transaction
+from django.db.models import (Case, Exists, F, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value, When, Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 
 import constants
-from users.models import User
+from foodgram.db import delete_returning, insert_ignore
+from recipes import similarity
+from recipes.storage import recipe_image_storage
+from users.models import Follow, User
 
 
 class Tag(models.Model):
@@ -67,6 +76,52 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, user):
+        """Всё необходимое для вывода рецептов за постоянное число запросов."""
+        queryset = self.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        )
+        if user.is_anonymous:
+            return queryset.select_related('author')
+        return queryset.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.with_is_subscribed(user)
+            )
+        ).annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+    def first_per_author(self, limit):
+        """Не более limit первых рецептов каждого автора одним запросом."""
+        if not connection.features.supports_over_clause:
+            return self.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('name', 'id').values('id')[:limit]
+            ))
+        ranked = self.order_by().annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('name').asc(), F('id').asc())
+        )).values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.row_number <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -80,7 +135,14 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         'Картинка',
-        upload_to='media/'
+        upload_to='recipes/',
+        storage=recipe_image_storage
+    )
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False
     )
     text = models.CharField(
         'Описание рецепта',
@@ -95,6 +157,11 @@ class Recipe(models.Model):
         Tag,
         verbose_name='Теги'
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления',
         validators=[
@@ -107,14 +174,33 @@ class Recipe(models.Model):
         ]
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-favorites_count', 'id'],
+                         name='recipe_popularity_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # favorites_count меняют только F()-обновления избранного,
+        # иначе сохранение загруженной ранее копии затрёт новые значения.
+        if not self._state.adding:
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name
+                                 for field in self._meta.concrete_fields
+                                 if not field.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields
+                                       if name != 'favorites_count']
+        super().save(*args, **kwargs)
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -154,6 +240,57 @@ class RecipeIngredient(models.Model):
         ]
 
 
+class FavoriteShoppingCartManager(models.Manager):
+
+    def add(self, user, recipe_ids):
+        """Добавляет рецепты пользователю, возвращает добавленные."""
+        with transaction.atomic(using=self.db):
+            added = [recipe_id for _, recipe_id in insert_ignore(
+                self.model, ('user', 'recipe'),
+                [(user.id, recipe_id) for recipe_id in recipe_ids],
+                using=self.db
+            )]
+            if added:
+                self.changed(user, added, 1)
+        return added
+
+    def remove(self, user, recipe_ids):
+        """Убирает рецепты у пользователя, возвращает убранные."""
+        recipe_ids = list(recipe_ids)
+        rows = self.filter(user=user, recipe_id__in=recipe_ids)
+        with transaction.atomic(using=self.db):
+            if len(recipe_ids) == 1:
+                removed = recipe_ids if rows.delete()[0] else []
+            elif connections[self.db].vendor == 'postgresql':
+                removed = delete_returning(
+                    self.model, {'user': user.id, 'recipe': recipe_ids},
+                    'recipe', using=self.db)
+            else:
+                removed = list(rows.select_for_update().values_list(
+                    'recipe_id', flat=True))
+                rows.filter(recipe_id__in=removed).delete()
+            if removed:
+                self.changed(user, removed, -1)
+        return removed
+
+    def changed(self, user, recipe_ids, sign):
+        """Обновляет зависимые данные после добавления или удаления."""
+
+
+class FavoriteManager(FavoriteShoppingCartManager):
+
+    def changed(self, user, recipe_ids, sign):
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            favorites_count=F('favorites_count') + sign)
+
+
+class ShoppingCartManager(FavoriteShoppingCartManager):
+
+    def changed(self, user, recipe_ids, sign):
+        ShoppingCartIngredient.objects.apply_recipes([user.id], recipe_ids,
+                                                     sign)
+
+
 class FavoriteShoppingCart(models.Model):
 
     user = models.ForeignKey(
@@ -173,6 +310,8 @@ class FavoriteShoppingCart(models.Model):
 
 class Favorite(FavoriteShoppingCart):
 
+    objects = FavoriteManager()
+
     class Meta:
         default_related_name = 'favorites'
         ordering = ['user']
@@ -191,12 +330,323 @@ class Favorite(FavoriteShoppingCart):
 
 class ShoppingCart(FavoriteShoppingCart):
 
+    objects = ShoppingCartManager()
+
     class Meta:
         default_related_name = 'carts'
         ordering = ['user']
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_user_cart_recipe'
+            )
+        ]
 
     def __str__(self):
         return (f'{self.user.username} добавил'
                 f'{self.recipe.name} в список покупок.')
+
+
+class ShoppingCartIngredientManager(models.Manager):
+
+    def apply(self, user_ids, amounts):
+        """Прибавляет amounts {ingredient_id: delta} к спискам user_ids."""
+        amounts = {key: value for key, value in amounts.items() if value}
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [self.model(user_id=user_id, ingredient_id=ingredient_id,
+                            amount=0)
+                 for user_id in user_ids
+                 for ingredient_id, delta in amounts.items() if delta > 0],
+                ignore_conflicts=True
+            )
+            rows = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+            rows.update(amount=F('amount') + Case(
+                *(When(ingredient_id=ingredient_id, then=Value(delta))
+                  for ingredient_id, delta in amounts.items()),
+                default=Value(0)
+            ))
+            rows.filter(amount__lte=0).delete()
+
+    def apply_recipe(self, user_ids, recipe, sign=1):
+        """Добавляет (sign=1) или убирает (sign=-1) ингредиенты рецепта."""
+        self.apply_recipes(user_ids, [recipe.pk], sign)
+
+    def apply_recipes(self, user_ids, recipe_ids, sign=1):
+        """То же, что apply_recipe, для нескольких рецептов сразу."""
+        self.apply(user_ids, {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('ingredient_id').annotate(
+                total=Sum('amount')
+            ).order_by()
+        })
+
+    def expected(self, user_ids=None):
+        """Суммы, посчитанные заново по рецептам в списках покупок."""
+        lookup = {'recipe__carts__isnull': False}
+        if user_ids is not None:
+            lookup = {'recipe__carts__user_id__in': user_ids}
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in RecipeIngredient.objects.filter(**lookup).values_list(
+                'recipe__carts__user_id', 'ingredient_id'
+            ).annotate(total=Sum('amount')).order_by()
+        }
+
+    def rebuild(self, user_ids=None):
+        """Пересобирает суммы для user_ids или для всех пользователей."""
+        rows = self.all()
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=user_ids)
+        with transaction.atomic():
+            rows.delete()
+            self.bulk_create(
+                self.model(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=amount)
+                for (user_id, ingredient_id), amount
+                in self.expected(user_ids).items()
+            )
+
+
+class ShoppingCartIngredient(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        'Количество ингредиента',
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        default_related_name = 'cart_ingredients'
+        ordering = ['user']
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_cart_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user.username}: {self.ingredient.name} {self.amount}'
+
+
+class FeedEntryManager(models.Manager):
+
+    def trim(self, user_ids):
+        """Оставляет в лентах user_ids не больше FEED_MAX_LENGTH записей.
+
+        user_ids — список или подзапрос с id пользователей.
+        """
+        self.filter(
+            user_id__in=user_ids,
+            recipe_id__lt=Subquery(
+                self.filter(user=OuterRef('user')).order_by(
+                    '-recipe_id'
+                ).values('recipe_id')[constants.FEED_MAX_LENGTH - 1:
+                                      constants.FEED_MAX_LENGTH]
+            )
+        ).delete()
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора.
+
+        Подписчики обходятся пачками по id, а ленты каждой пачки
+        обрезаются по подзапросу, без длинных списков параметров.
+        """
+        followers = Follow.objects.filter(
+            author_id=recipe.author_id
+        ).order_by('user_id').values_list('user_id', flat=True)
+        batch = list(followers[:constants.FEED_BATCH_SIZE])
+        while batch:
+            self.bulk_create(
+                (self.model(user_id=user_id, author_id=recipe.author_id,
+                            recipe=recipe)
+                 for user_id in batch),
+                ignore_conflicts=True
+            )
+            self.trim(followers.filter(user_id__gte=batch[0],
+                                       user_id__lte=batch[-1]))
+            batch = list(followers.filter(
+                user_id__gt=batch[-1])[:constants.FEED_BATCH_SIZE])
+
+    def backfill(self, user, author):
+        """Добавляет в ленту user последние рецепты author."""
+        self.bulk_create(
+            (self.model(user=user, author=author, recipe_id=recipe_id)
+             for recipe_id in author.recipes.order_by('-id').values_list(
+                 'id', flat=True)[:constants.FEED_MAX_LENGTH]),
+            ignore_conflicts=True
+        )
+        self.trim([user.id])
+
+    def remove(self, user, author):
+        """Убирает рецепты author из ленты user."""
+        self.filter(user=user, author=author).delete()
+
+
+class FeedEntry(models.Model):
+    """Рецепт автора в ленте подписчика."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        ordering = ['user']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_user_feed_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'author'],
+                         name='feed_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
+
+
+class SimilarRecipeManager(models.Manager):
+
+    def features(self, recipe_ids=None):
+        """Признаки рецептов {id: {id ингредиентов и -id тегов}}."""
+        ingredients = RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id')
+        tags = Recipe.tags.through.objects.values_list('recipe_id', 'tag_id')
+        if recipe_ids is not None:
+            ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+            tags = tags.filter(recipe_id__in=recipe_ids)
+        features = defaultdict(set)
+        for recipe_id, ingredient_id in ingredients.order_by():
+            features[recipe_id].add(ingredient_id)
+        for recipe_id, tag_id in tags.order_by():
+            features[recipe_id].add(-tag_id)
+        return features
+
+    def rebuild(self):
+        """Пересчитывает соседей всех рецептов."""
+        table = similarity.top_k_all(self.features(),
+                                     constants.SIMILAR_RECIPES_COUNT)
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (self.model(recipe_id=recipe_id, similar_id=similar_id,
+                            score=score)
+                 for recipe_id, neighbours in table.items()
+                 for score, similar_id in neighbours),
+                batch_size=constants.SIMILAR_RECIPES_BATCH_SIZE
+            )
+
+    def refresh(self, recipe_id):
+        """Пересчитывает соседей рецепта и его место у кандидатов."""
+        limit = constants.SIMILAR_RECIPES_COUNT
+        own = self.features([recipe_id]).get(recipe_id, set())
+        features = self.features(
+            RecipeIngredient.objects.filter(
+                ingredient_id__in=[feature for feature in own if feature > 0]
+            ).exclude(recipe_id=recipe_id).values('recipe_id')
+        )
+        recipe_scores = similarity.scores(
+            own, features, similarity.build_index(features))
+        with transaction.atomic():
+            self.filter(Q(recipe_id=recipe_id) | Q(similar_id=recipe_id)
+                        ).delete()
+            rows = [
+                self.model(recipe_id=recipe_id, similar_id=similar_id,
+                           score=score)
+                for score, similar_id in similarity.top(recipe_scores, limit)
+            ]
+            current = defaultdict(list)
+            for pk, owner_id, score in self.filter(
+                    recipe_id__in=recipe_scores).values_list(
+                    'pk', 'recipe_id', 'score'):
+                current[owner_id].append((score, pk))
+            stale = []
+            for owner_id, score in recipe_scores.items():
+                if len(current[owner_id]) >= limit:
+                    weakest_score, weakest_pk = min(current[owner_id])
+                    if score <= weakest_score:
+                        continue
+                    stale.append(weakest_pk)
+                rows.append(self.model(recipe_id=owner_id,
+                                       similar_id=recipe_id, score=score))
+            self.filter(pk__in=stale).delete()
+            self.bulk_create(rows)
+
+
+class SimilarRecipe(models.Model):
+    """Один из ближайших по составу рецептов."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_entries',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField('Сходство')
+
+    objects = SimilarRecipeManager()
+
+    class Meta:
+        ordering = ['recipe', '-score']
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_recipe_similar'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.images import schedule_variants
+from recipes.models import FeedEntry, Recipe, ShoppingCartIngredient
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_carts(sender, instance, **kwargs):
+    """Вычитает удаляемый рецепт из сумм в списках покупок."""
+    ShoppingCartIngredient.objects.apply_recipe(
+        instance.carts.values_list('user_id', flat=True), instance, sign=-1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_variants(sender, instance, raw=False, **kwargs):
+    """Заново готовит копии картинки, если она сменилась."""
+    if (not raw and instance.image
+            and instance.image_variants.get('source') != instance.image.name):
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_to_feeds(sender, instance, created, raw=False, **kwargs):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if created and not raw:
+        FeedEntry.objects.fan_out(instance)
@@ -0,0 +1,59 @@
+"""Похожие рецепты: мера Жаккара по ингредиентам и тегам.
+
+Рецепт описывается множеством признаков: id ингредиентов и id тегов
+со знаком минус. Кандидаты берутся из обратного индекса по
+ингредиентам, поэтому попарно сравниваются только рецепты
+с общими ингредиентами.
+"""
+import heapq
+from collections import defaultdict
+
+
+def jaccard(overlap, size, other_size):
+    return overlap / (size + other_size - overlap)
+
+
+def build_index(features):
+    """Обратный индекс {ингредиент: [id рецептов]}."""
+    index = defaultdict(list)
+    for recipe_id, recipe_features in features.items():
+        for feature in recipe_features:
+            if feature > 0:
+                index[feature].append(recipe_id)
+    return index
+
+
+def scores(recipe_features, features, index, exclude=None):
+    """Сходство с каждым кандидатом {id рецепта: оценка}."""
+    candidates = set()
+    for feature in recipe_features:
+        if feature > 0:
+            candidates.update(index.get(feature, ()))
+    candidates.discard(exclude)
+    size = len(recipe_features)
+    return {
+        candidate_id: jaccard(
+            len(recipe_features & features[candidate_id]),
+            size, len(features[candidate_id])
+        )
+        for candidate_id in candidates
+    }
+
+
+def top(recipe_scores, limit):
+    """limit лучших пар (оценка, id), при равенстве — меньший id."""
+    return heapq.nsmallest(
+        limit, ((score, recipe_id) for recipe_id, score
+                in recipe_scores.items()),
+        key=lambda pair: (-pair[0], pair[1])
+    )
+
+
+def top_k_all(features, limit):
+    """Соседи всех рецептов {id рецепта: [(оценка, id соседа)]}."""
+    index = build_index(features)
+    return {
+        recipe_id: top(scores(recipe_features, features, index,
+                              exclude=recipe_id), limit)
+        for recipe_id, recipe_features in features.items()
+    }
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хеш его содержимого.
+
+    Одинаковые файлы записываются на диск один раз, а их адреса
+    никогда не меняются, поэтому nginx может кешировать их навсегда.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, basename = os.path.split(name)
+        name = os.path.join(directory, digest[:2],
+                            digest + os.path.splitext(basename)[1].lower())
+        full_path = self.path(name)
+        try:
+            # Свежий mtime не даёт очистке удалить переиспользованный файл.
+            os.utime(full_path)
+            return name.replace('\\', '/')
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(full_path))
+        try:
+            if hasattr(content, 'temporary_file_path'):
+                os.close(fd)
+                file_move_safe(content.temporary_file_path(), temp_path,
+                               allow_overwrite=True)
+            else:
+                content.seek(0)
+                with os.fdopen(fd, 'wb') as file:
+                    for chunk in content.chunks():
+                        file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name.replace('\\', '/')
+
+    def referenced(self):
+        """Все файлы хранилища, на которые ссылаются рецепты."""
+        from recipes.models import Recipe
+
+        names = set()
+        for image, variants in Recipe.objects.values_list(
+                'image', 'image_variants'):
+            names.add(image)
+            names.update(
+                name for formats in variants.values()
+                if isinstance(formats, dict) for name in formats.values()
+            )
+        return names
+
+    def walk(self, directory):
+        """Имена всех файлов внутри directory."""
+        if not self.exists(directory):
+            return
+        directories, files = self.listdir(directory)
+        for file in files:
+            yield os.path.join(directory, file).replace('\\', '/')
+        for subdirectory in directories:
+            yield from self.walk(os.path.join(directory, subdirectory))
+
+
+recipe_image_storage = ContentAddressedStorage()
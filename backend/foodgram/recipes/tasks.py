@@ -0,0 +1,32 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+
+import constants
+
+
+logger = logging.getLogger(__name__)
+
+# Один поток: пересчёты соседних рецептов задевают одни и те же строки.
+executor = ThreadPoolExecutor(max_workers=constants.SIMILAR_RECIPES_WORKERS,
+                              thread_name_prefix='similar-recipes')
+
+
+def refresh_similar(recipe_id):
+    from recipes.models import SimilarRecipe
+
+    try:
+        SimilarRecipe.objects.refresh(recipe_id)
+    except Exception:
+        logger.exception('Не удалось пересчитать похожие рецепты %s',
+                         recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_similar(recipe):
+    """Пересчитывает похожие рецепты в фоне после фиксации транзакции."""
+    transaction.on_commit(
+        lambda: executor.submit(refresh_similar, recipe.pk)
+    )
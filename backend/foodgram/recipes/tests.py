@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow, User
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name, email=f'{name}@example.com', password='password',
+        first_name='Имя', last_name='Фамилия')
+
+
+@mock.patch('constants.FEED_MAX_LENGTH', 2)
+@mock.patch('constants.FEED_BATCH_SIZE', 2)
+class FeedFanOutTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.followers = [create_user(f'follower{i}') for i in range(5)]
+        Follow.objects.bulk_create(
+            Follow(user=user, author=cls.author) for user in cls.followers)
+
+    def create_recipe(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, text='Текст', cooking_time=10,
+            image='recipes/temp.png')
+
+    def test_feeds_get_latest_recipes(self):
+        recipes = [self.create_recipe(f'Рецепт {i}') for i in range(3)]
+        for user in self.followers:
+            self.assertEqual(
+                sorted(user.feed_entries.values_list('recipe_id', flat=True)),
+                [recipes[1].id, recipes[2].id])
+
+    def test_batches_without_follower_id_lists(self):
+        self.create_recipe('Первый')
+        self.create_recipe('Второй')
+        with CaptureQueriesContext(connection) as context:
+            recipe = self.create_recipe('Третий')
+        self.assertEqual(FeedEntry.objects.filter(recipe=recipe).count(), 5)
+        deletes = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('DELETE')]
+        # По пачке на каждые два подписчика, ленты режутся подзапросом.
+        self.assertEqual(len(deletes), 3)
+        for sql in deletes:
+            self.assertRegex(
+                sql, r'"user_id" IN \(SELECT U0."user_id" FROM "users_follow"')
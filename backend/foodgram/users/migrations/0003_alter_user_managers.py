@@ -0,0 +1,20 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:49
+
+from django.db import migrations
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_follow_options'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', users.models.CustomUserManager()),
+            ],
+        ),
+    ]
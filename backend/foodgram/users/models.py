@@ -1,9 +1,25 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 
 import constants
 
 
+class UserQuerySet(models.QuerySet):
+
+    def with_is_subscribed(self, user):
+        """Аннотирует is_subscribed: подписан ли user на пользователя."""
+        if user.is_anonymous:
+            return self.annotate(is_subscribed=Value(False))
+        return self.annotate(is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('pk'))
+        ))
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    """UserManager с методами UserQuerySet."""
+
+
 class User(AbstractUser):
     password = models.CharField(
         'Пароль',
@@ -22,6 +38,8 @@ class User(AbstractUser):
         'last_name'
     )
 
+    objects = CustomUserManager()
+
     class Meta:
         ordering = ['username']
         verbose_name = 'Пользователь'